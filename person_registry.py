@@ -1,16 +1,24 @@
+import copy
+import os
 import random
 import yaml
-from dataclasses import dataclass
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum, auto
-from uuid import UUID, uuid4
 import logging
-from time import sleep
+from time import monotonic, sleep
 import csv
+import operator
+from itertools import count
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+_YAML_CACHE_SIZE = 16
+_STREAM_FLUSH_INTERVAL = 5.0
+_YAML_CACHE: OrderedDict[tuple[str, float, int], dict] = OrderedDict()
+
 
 class Config:
     def __init__(self, config_path):
@@ -18,9 +26,21 @@ class Config:
 
     def load(self):
         try:
+            stat = os.stat(self.config_path)
+            key = (os.path.abspath(self.config_path),
+                   stat.st_mtime, stat.st_size)
+            if key in _YAML_CACHE:
+                _YAML_CACHE.move_to_end(key)
+                return copy.deepcopy(_YAML_CACHE[key])
+
             with open(self.config_path) as f:
-                config = yaml.safe_load(f)
-            return config
+                loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+                config = yaml.load(f, Loader=loader)
+
+            _YAML_CACHE[key] = config
+            if len(_YAML_CACHE) > _YAML_CACHE_SIZE:
+                _YAML_CACHE.popitem(last=False)
+            return copy.deepcopy(config)
         except FileNotFoundError:
             raise FileNotFoundError(
                 f"Config file not found: {self.config_path}")
@@ -36,6 +56,13 @@ class Statuses(Enum):
 
 
 class Person:
+    __slots__ = ('name', 'surname', 'email', 'processing_time',
+                 'assigned_at', 'registered_at', 'completed_at',
+                 'assigned_at_iso', 'registered_at_iso', 'completed_at_iso',
+                 'due_tick', 'status', 'id_no')
+
+    _next_id = count()
+
     def __init__(self, name, surname, email, processing_time):
         self.name: str = name
         self.surname: str = surname
@@ -44,8 +71,12 @@ class Person:
         self.assigned_at: datetime | None = None
         self.registered_at: datetime | None = None
         self.completed_at: datetime | None = None
+        self.assigned_at_iso: str = ""
+        self.registered_at_iso: str = ""
+        self.completed_at_iso: str = ""
+        self.due_tick: int | None = None
         self.status: Statuses = Statuses.UNASSIGNED
-        self.id_no: UUID = uuid4()
+        self.id_no: int = next(Person._next_id)
 
     def __str__(self):
         return (f'{self.name} {self.surname}, '
@@ -56,31 +87,60 @@ class Person:
                 f'Status:{self.status.name}, '
                 f'Processing time:{self.processing_time} ')
 
-    def register(self):
-        self.registered_at = datetime.now()
+    def register(self, now: datetime | None = None):
+        self.registered_at = now if now is not None else datetime.now()
+        self.registered_at_iso = self.registered_at.isoformat()
         self.status = Statuses.WAITING
 
-    def assign(self):
-        self.assigned_at = datetime.now()
+    def assign(self, now: datetime | None = None):
+        self.assigned_at = now if now is not None else datetime.now()
+        self.assigned_at_iso = self.assigned_at.isoformat()
         self.status = Statuses.ASSIGNED
 
 
 class Registry:
+    _CSV_HEADER = ("Id_no",
+                   "Name",
+                   "Surname",
+                   "Email",
+                   "Registered",
+                   "Assigned",
+                   "Completed")
+    _row_getter = operator.attrgetter("id_no",
+                                      "name",
+                                      "surname",
+                                      "email",
+                                      "registered_at_iso",
+                                      "assigned_at_iso",
+                                      "completed_at_iso")
+
     def __init__(self, limit: int = 20):
         self.limit = limit
-        self.__assigned_list: list[Person] = []
-        self.__awaiting_queue: list[Person] = []
+        self.__assigned_list: dict[int, Person] = {}
+        self.__awaiting_queue: deque[Person] = deque()
         self.__completed_list: list[Person] = []
-        self.__seen_ids: set[UUID] = set()
+        self.__completed_count: int = 0
+        self.__stream_file = None
+        self.__stream_writer = None
+        self.__stream_flushed_at: float = 0.0
+        self.__streamed: bool = False
+        self.__awaiting_ids: set[int] = set()
+        self.__tick: int = 0
+        self.__due: dict[int, dict[int, Person]] = {}
 
     @property
     def assigned_list(self):
-        return tuple(self.__assigned_list)
+        return tuple(self.__assigned_list.values())
 
     @property
     def completed_list(self):
+        """Completed persons not yet written out by streaming."""
         return tuple(self.__completed_list)
 
+    @property
+    def completed_count(self) -> int:
+        return self.__completed_count
+
     @property
     def awaiting_queue(self):
         return tuple(self.__awaiting_queue)
@@ -89,70 +149,129 @@ class Registry:
     def available_tickets(self) -> int:
         return self.limit - len(self.__assigned_list)
 
-    def add(self, person: Person):
-        if person.id_no in self.__seen_ids:
+    def tick(self) -> list[Person]:
+        self.__tick += 1
+        due = self.__due.pop(self.__tick, None)
+        if not due:
+            return []
+        return list(due.values())
+
+    def __assign(self, person: Person, now: datetime | None = None):
+        person.assign(now)
+        person.due_tick = self.__tick + max(person.processing_time, 1)
+        self.__due.setdefault(person.due_tick, {})[person.id_no] = person
+        self.__assigned_list[person.id_no] = person
+
+    def add(self, person: Person, now: datetime | None = None):
+        if (person.id_no in self.__assigned_list
+                or person.id_no in self.__awaiting_ids):
             logger.info("You cannot add the same person twice")
             return
 
-        self.__seen_ids.add(person.id_no)
-
         if person.registered_at is None:
-            person.register()
+            person.register(now)
 
         if self.available_tickets > 0:
-            person.assign()
-            self.__assigned_list.append(person)
+            self.__assign(person, now)
         else:
             self.__awaiting_queue.append(person)
+            self.__awaiting_ids.add(person.id_no)
 
-    def promote(self):
+    def promote(self, now: datetime | None = None):
         while self.__awaiting_queue and self.available_tickets > 0:
-            next_person = self.__awaiting_queue.pop(0)
-            next_person.assign()
-            self.__assigned_list.append(next_person)
-
-    def complete(self, person):
-        person.completed_at = datetime.now()
-        person.status = Statuses.COMPLETED
-        self.__assigned_list.remove(person)
-        self.__seen_ids.discard(person.id_no)
-        self.__completed_list.append(person)
-        self.promote()
+            next_person = self.__awaiting_queue.popleft()
+            self.__awaiting_ids.discard(next_person.id_no)
+            self.__assign(next_person, now)
+
+    def complete(self, person, now: datetime | None = None):
+        self.complete_many([person], now)
+
+    def complete_many(self, people: list[Person],
+                      now: datetime | None = None):
+        if self.__streamed and self.__stream_writer is None:
+            raise RuntimeError(
+                "Registry stream is closed, no more completions accepted")
+
+        now = now if now is not None else datetime.now()
+        now_iso = now.isoformat()
+        for person in people:
+            person.completed_at = now
+            person.completed_at_iso = now_iso
+            person.status = Statuses.COMPLETED
+            del self.__assigned_list[person.id_no]
+            due = self.__due.get(person.due_tick)
+            if due is not None:
+                due.pop(person.id_no, None)
+                if not due:
+                    del self.__due[person.due_tick]
+        self.__completed_count += len(people)
+
+        if self.__stream_writer is not None:
+            if people:
+                self.__stream_writer.writerows(
+                    map(self._row_getter, people))
+            if (monotonic() - self.__stream_flushed_at
+                    >= _STREAM_FLUSH_INTERVAL):
+                self.__stream_file.flush()
+                self.__stream_flushed_at = monotonic()
+        else:
+            self.__completed_list.extend(people)
+        self.promote(now)
+
+    @staticmethod
+    def __open_csv(file):
+        f = open(file, 'w', encoding="UTF-8", newline="",
+                 buffering=1 << 20)
+        data = csv.writer(f, delimiter=',')
+        data.writerow(Registry._CSV_HEADER)
+        return f, data
+
+    def start_streaming(self, file):
+        """Write completed persons to file as they finish.
+
+        Streaming can be started once per registry. After stop_streaming
+        the registry accepts no further completions and save is refused.
+        """
+        if self.__streamed:
+            raise RuntimeError("Registry has already streamed to CSV")
+
+        self.__stream_file, self.__stream_writer = self.__open_csv(file)
+        self.__stream_writer.writerows(
+            map(self._row_getter, self.__completed_list))
+        self.__completed_list.clear()
+        self.__stream_flushed_at = monotonic()
+        self.__streamed = True
+
+    def stop_streaming(self):
+        if self.__stream_file is not None:
+            self.__stream_file.close()
+        self.__stream_file = None
+        self.__stream_writer = None
 
     def save(self, file):
-        with open(file, 'w', encoding="UTF-8") as f:
-            data = csv.writer(f, delimiter=',')
-            data.writerow(["Id_no",
-                           "Name",
-                           "Surname",
-                           "Email",
-                           "Registered",
-                           "Assigned",
-                           "Completed"])
-
-            for record in self.__completed_list:
-                data.writerow([
-                    str(record.id_no),
-                    record.name,
-                    record.surname,
-                    record.email,
-                    (record.registered_at.isoformat()
-                     if record.registered_at else ""),
-                    (record.assigned_at.isoformat()
-                     if record.assigned_at else ""),
-                    (record.completed_at.isoformat()
-                     if record.completed_at else "")
-                ])
+        if self.__streamed:
+            raise RuntimeError(
+                "Completed records were streamed to CSV and cannot be saved")
+
+        f, data = self.__open_csv(file)
+        with f:
+            data.writerows(map(self._row_getter, self.__completed_list))
 
     def report_detailed(self, added: int = 0, finished: int = 0):
-        assigned_count = len(self.__assigned_list)
-        awaiting_count = len(self.__awaiting_queue)
-        completed_count = len(self.__completed_list)
-        logger.info(f"Users Added: {added} | "
-                    f"Users Finished: {finished} | "
-                    f"Users Assigned: {assigned_count}/{self.limit} | "
-                    f"Users Awaiting: {awaiting_count} | "
-                    f"Users Completed total: {completed_count}")
+        if not logger.isEnabledFor(logging.INFO):
+            return
+
+        logger.info("Users Added: %d | "
+                    "Users Finished: %d | "
+                    "Users Assigned: %d/%d | "
+                    "Users Awaiting: %d | "
+                    "Users Completed total: %d",
+                    added,
+                    finished,
+                    len(self.__assigned_list),
+                    self.limit,
+                    len(self.__awaiting_queue),
+                    self.__completed_count)
 
 
 @dataclass
@@ -163,24 +282,34 @@ class PersonGenerator:
     max_processing_time: int
     names: list[str]
     surnames: list[str]
+    _rng: random.Random = field(
+        default_factory=random.Random, init=False, repr=False,
+        compare=False)
+    _email_cache: dict[tuple[str, str], str] = field(
+        default_factory=dict, init=False, repr=False, compare=False)
+
+    def email(self, name: str, surname: str) -> str:
+        key = (name, surname)
+        email = self._email_cache.get(key)
+        if email is None:
+            email = self._email_cache[key] = f'{name}.{surname}@gmail.com'
+        return email
 
     def generate(self):
-        list_users = []
-        number_users = random.randint(self.min_user_per_tick,
-                                      self.max_user_per_tick)
-
-        for _ in range(number_users):
-            name = random.choice(self.names)
-            surname = random.choice(self.surnames)
-            email = f'{name}.{surname}@gmail.com'
-            processing_time = random.randint(self.min_processing_time,
-                                             self.max_processing_time)
-
-            list_users.append(Person(name=name,
-                                     surname=surname,
-                                     email=email,
-                                     processing_time=processing_time))
-        return list_users
+        number_users = self._rng.randint(self.min_user_per_tick,
+                                         self.max_user_per_tick)
+        names = self._rng.choices(self.names, k=number_users)
+        surnames = self._rng.choices(self.surnames, k=number_users)
+        processing_times = self._rng.choices(
+            range(self.min_processing_time, self.max_processing_time + 1),
+            k=number_users)
+
+        return [Person(name=name,
+                       surname=surname,
+                       email=self.email(name, surname),
+                       processing_time=processing_time)
+                for name, surname, processing_time
+                in zip(names, surnames, processing_times)]
 
 
 class PipelineOrchestrator:
@@ -196,33 +325,34 @@ class PipelineOrchestrator:
         self.tick_time_interval = tick_time_interval
 
     def run(self):
+        self.registry.start_streaming(config["file"]["output"])
         try:
+            next_deadline = monotonic() + self.tick_time_interval
             while self.tick_interval > 0:
                 self.tick_interval -= 1
+                now = datetime.now()
 
-                for person in self.registry.assigned_list:
-                    person.processing_time -= 1
-
-                finished = [p for p in self.registry.assigned_list
-                            if p.processing_time <= 0]
-
-                for person in finished:
-                    self.registry.complete(person)
+                finished = self.registry.tick()
+                self.registry.complete_many(finished, now=now)
 
                 users = self.generator.generate()
                 for user in users:
-                    self.registry.add(user)
+                    self.registry.add(user, now=now)
 
                 self.registry.report_detailed(len(users), len(finished))
-                sleep(self.tick_time_interval)
+                delay = next_deadline - monotonic()
+                if delay > 0:
+                    sleep(delay)
+                next_deadline += self.tick_time_interval
         except KeyboardInterrupt:
             logger.info("Simulation stopped by user")
 
-        logger.info(f"Simulation finished. "
-                    f"Total completed: {len(self.registry.completed_list)}")
+        finally:
+            self.registry.stop_streaming()
 
-        self.registry.save(file=config["file"]["output"])
-        logger.info("Process Saved")
+        logger.info(f"Simulation finished. "
+                    f"Total completed: {self.registry.completed_count}")
+        logger.info("Output stream closed")
 
 
 if __name__ == "__main__":
@@ -232,6 +362,10 @@ if __name__ == "__main__":
     if config["registry"]["limit"] <= 0:
         raise ValueError("Registry limit must be positive")
 
+    if (config["generator"]["min_processing_time"]
+            > config["generator"]["max_processing_time"]):
+        raise ValueError("Min processing time must not exceed max")
+
     registry = Registry(limit=config["registry"]["limit"])
     generator = PersonGenerator(config["generator"]["min_user_per_tick"],
                                 config["generator"]["max_user_per_tick"],